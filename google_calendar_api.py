@@ -1,21 +1,61 @@
 
 import os
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from datetime import datetime # Import datetime for mock API
+import re
+import asyncio
+import calendar
+import functools
+import orjson
+from datetime import datetime, timezone # Import datetime for mock API
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
 
 # SCOPES required for Calendar API access
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 TOKEN_FILE = 'token.json'
 CREDENTIALS_FILE = 'credentials.json' # Your OAuth 2.0 client secrets file
+CALENDAR_API_BASE = 'https://www.googleapis.com/calendar/v3'
+# Zone for naive timestamps, matching the tools' Asia/Kolkata
+_TZ = ZoneInfo('Asia/Kolkata')
+
+# google-auth, aiohttp and NumPy are imported inside the functions that need them, so
+# importing this module (and tools, which the terminal bot loads at startup) stays
+# cheap and Streamlit-free.
+
+# Matches the canonical 'YYYY-MM-DDTHH:MM:SS[.fff][Z|±HH:MM]' strings the tools produce.
+_ISO_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?(?:(Z)|([+-]\d\d):?(\d\d))?')
+
+def _iso_to_epoch(s, _match=_ISO_RE.fullmatch, _timegm=calendar.timegm):
+    """
+    Converts an ISO-8601 string to epoch seconds, without building datetime objects for
+    the common UTC/offset forms. Naive strings are taken to be local time in _TZ.
+    """
+    m = _match(s)
+    if m is None or not (m[7] or m[8]):
+        dt = datetime.fromisoformat(s)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=_TZ)
+        return dt.timestamp()
+    y, mo, d, h, mi, se, z, oh, om = m.groups()
+    offset = 0 if z else int(oh) * 3600 + int(om) * 60 * (1 if oh[0] == '+' else -1)
+    return _timegm((int(y), int(mo), int(d), int(h), int(mi), int(se))) - offset
+
+@functools.lru_cache(maxsize=1)
+def get_google_credentials():
+    """
+    Loads (refreshing or running the OAuth flow if needed) and returns the Calendar
+    credentials used by AsyncCalendarClient.
+    Cached for the process, so token.json is read once; later refreshes happen in memory
+    (google-auth refreshes a few minutes ahead of expiry) without touching disk.
+    """
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
 
-def get_google_calendar_service():
-    """Authenticates and returns a Google Calendar API service."""
     creds = None
+    old_token = None
     if os.path.exists(TOKEN_FILE):
         creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+        old_token = creds.token
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
@@ -23,65 +63,216 @@ def get_google_calendar_service():
             flow = InstalledAppFlow.from_client_secrets_file(
                 CREDENTIALS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
+    # Only rewrite token.json when the token actually changed
+    if creds.token != old_token:
         with open(TOKEN_FILE, 'w') as token:
             token.write(creds.to_json())
-    
-    return build('calendar', 'v3', credentials=creds)
+    return creds
+
+class AsyncCalendarClient:
+    """
+    Minimal aiohttp-based Calendar v3 client for the calls the tools make, so they can
+    be awaited instead of blocking the event loop.
+    """
+
+    def __init__(self, creds):
+        self._creds = creds
+        # aiohttp sessions and asyncio locks belong to one event loop, and each
+        # Streamlit session runs its own, so both are kept per loop until aclose().
+        self._per_loop = {}
+
+    def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        state = self._per_loop.get(loop)
+        if state is None:
+            import aiohttp
+            # orjson encodes request bodies and decodes responses several times faster than json
+            session = aiohttp.ClientSession(json_serialize=lambda obj: orjson.dumps(obj).decode())
+            state = (session, asyncio.Lock())
+            self._per_loop[loop] = state
+        return state
+
+    async def _request(self, method, path, **kwargs):
+        session, refresh_lock = self._loop_state()
+        if not self._creds.valid:
+            async with refresh_lock:
+                if not self._creds.valid:
+                    from google.auth.transport.requests import Request
+                    await asyncio.to_thread(self._creds.refresh, Request())
+        headers = {'Authorization': f'Bearer {self._creds.token}'}
+        async with session.request(method, CALENDAR_API_BASE + path, headers=headers, **kwargs) as response:
+            response.raise_for_status()
+            return await response.json(loads=orjson.loads)
+
+    async def aclose(self):
+        """Closes the aiohttp session opened on the running event loop, if any."""
+        state = self._per_loop.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].close()
+
+    async def insert_event(self, calendarId, eventBody):
+        return await self._request('POST', f'/calendars/{quote(calendarId, safe="")}/events', json=eventBody)
+
+    async def query_freebusy(self, body):
+        return await self._request('POST', '/freeBusy', json=body)
 
 class MockGoogleCalendarAPI:
     def __init__(self):
-        self.events = []  # Stores mock events
-
-    def list_events(self, calendarId, timeMin, timeMax):
-        """Simulates listing events for conflict checking."""
-        print(f"Mock API (Fallback): Checking conflicts in {calendarId} from {timeMin} to {timeMax}")
-        min_dt = datetime.fromisoformat(timeMin)
-        max_dt = datetime.fromisoformat(timeMax)
-
-        conflicting = [
-            event for event in self.events
-            if datetime.fromisoformat(event['start']['dateTime']) < max_dt and
-               datetime.fromisoformat(event['end']['dateTime']) > min_dt
-        ]
-        return {'items': conflicting}
+        # Events are kept sorted by start time, with their start/end epoch seconds
+        # stored in parallel int64 buffers so conflict checks are vectorized NumPy
+        # comparisons instead of re-parsing ISO strings per event.
+        import numpy as np
+        self._starts = np.empty(16, dtype=np.int64)
+        self._ends = np.empty_like(self._starts)
+        self._count = 0
+        self._max_duration = 0
+        self._events = []
+
+    def _overlapping(self, min_ts, max_ts):
+        """Returns the indices (in start order) of events overlapping [min_ts, max_ts)."""
+        import numpy as np
+        starts = self._starts[:self._count]
+        # Only events starting before max_ts can overlap the window, and since no event
+        # lasts longer than _max_duration, none starting at or before
+        # min_ts - _max_duration can still be running at min_ts.
+        hi = int(np.searchsorted(starts, max_ts, side='left'))
+        lo = int(np.searchsorted(starts[:hi], min_ts - self._max_duration, side='right'))
+        return lo + np.flatnonzero(self._ends[lo:hi] > min_ts)
 
     def insert_event(self, calendarId, eventBody):
         """Simulates inserting a new event."""
         print(f"Mock API (Fallback): Inserting event into {calendarId}:", eventBody)
+        event_number = len(self._events) + 1
         new_event = {
-            'id': f"mock_event_{len(self.events) + 1}",
+            'id': f"mock_event_{event_number}",
             'status': 'confirmed',
             'summary': eventBody['summary'],
             'start': eventBody['start'],
             'end': eventBody['end'],
-            'htmlLink': f"https://mockcalendar.google.com/event/{len(self.events) + 1}"
+            'htmlLink': f"https://mockcalendar.google.com/event/{event_number}"
         }
-        self.events.append(new_event)
+        import numpy as np
+
+        start_ts = int(_iso_to_epoch(eventBody['start']['dateTime']))
+        end_ts = int(_iso_to_epoch(eventBody['end']['dateTime']))
+
+        n = self._count
+        if n == len(self._starts):
+            # Grow the buffers geometrically so inserts stay amortized O(1) in allocations.
+            self._starts = np.resize(self._starts, 2 * n)
+            self._ends = np.resize(self._ends, 2 * n)
+        pos = int(np.searchsorted(self._starts[:n], start_ts, side='right'))
+        self._starts[pos + 1:n + 1] = self._starts[pos:n]
+        self._ends[pos + 1:n + 1] = self._ends[pos:n]
+        self._starts[pos] = start_ts
+        self._ends[pos] = end_ts
+        self._count = n + 1
+        self._max_duration = max(self._max_duration, end_ts - start_ts)
+        self._events.insert(pos, new_event)
         return new_event
 
-    def events(self):
-        return type('EventsService', (object,), {
-            'list': lambda **kwargs: type('ListRequest', (object,), {
-                'execute': lambda: self.list_events(
-                    calendarId=kwargs.get('calendarId'),
-                    timeMin=kwargs.get('timeMin'),
-                    timeMax=kwargs.get('timeMax')
-                )
-            })(),
-            'insert': lambda **kwargs: type('InsertRequest', (object,), {
-                'execute': lambda: self.insert_event(
-                    calendarId=kwargs.get('calendarId'),
-                    eventBody=kwargs.get('body')
-                )
-            })()
-        })()
-
-# Initialize the API resource (real or mock) when this module is imported
-try:
-    api_resource = get_google_calendar_service()
-    print("Google Calendar API service initialized successfully.")
-except Exception as e:
-    print(f"Error initializing Google Calendar API service: {e}")
-    print("Please ensure 'credentials.json' is present and you have completed the OAuth flow to generate 'token.json'.")
-    api_resource = MockGoogleCalendarAPI()
-    print("Using Mock Google Calendar API as a fallback.")
\ No newline at end of file
+    def query_freebusy(self, body):
+        """Simulates a FreeBusy query, returning pre-merged busy intervals per calendar."""
+        print(f"Mock API (Fallback): FreeBusy query from {body['timeMin']} to {body['timeMax']}")
+        idxs = self._overlapping(_iso_to_epoch(body['timeMin']), _iso_to_epoch(body['timeMax']))
+
+        busy = []
+        for start_ts, end_ts in zip(self._starts[idxs].tolist(), self._ends[idxs].tolist()):
+            if busy and start_ts <= busy[-1][1]:
+                busy[-1][1] = max(busy[-1][1], end_ts)
+            else:
+                busy.append([start_ts, end_ts])
+
+        intervals = [
+            {
+                'start': datetime.fromtimestamp(start_ts, timezone.utc).isoformat(),
+                'end': datetime.fromtimestamp(end_ts, timezone.utc).isoformat(),
+            }
+            for start_ts, end_ts in busy
+        ]
+        return {'calendars': {item['id']: {'busy': intervals} for item in body['items']}}
+
+class _AsyncMockCalendar:
+    """Awaitable view of MockGoogleCalendarAPI matching AsyncCalendarClient's methods."""
+    __slots__ = ('_api',)
+
+    def __init__(self, api):
+        self._api = api
+
+    async def aclose(self):
+        pass
+
+    async def insert_event(self, calendarId, eventBody):
+        return self._api.insert_event(calendarId, eventBody)
+
+    async def query_freebusy(self, body):
+        return self._api.query_freebusy(body)
+
+_async_api_resource = None
+_mock_api = None
+
+def _get_mock_api():
+    """Returns the process-wide mock calendar, so every session sees the same events."""
+    global _mock_api
+    if _mock_api is None:
+        _mock_api = MockGoogleCalendarAPI()
+        print("Using Mock Google Calendar API as a fallback.")
+    return _mock_api
+
+def get_async_api_resource():
+    """
+    Returns the awaitable Calendar client: an AsyncCalendarClient when OAuth credentials
+    can be loaded, otherwise an async view of the mock.
+    """
+    global _async_api_resource
+    if _async_api_resource is None:
+        try:
+            _async_api_resource = AsyncCalendarClient(get_google_credentials())
+        except Exception as e:
+            print(f"Error loading Google Calendar credentials: {e}")
+            print("Please ensure 'credentials.json' is present and you have completed the OAuth flow to generate 'token.json'.")
+            _async_api_resource = _AsyncMockCalendar(_get_mock_api())
+    return _async_api_resource
+
+async def aclose_async_api_resource():
+    """
+    Releases the async client's resources bound to the running event loop.
+    Call before that loop is closed; a no-op if the client was never built.
+    """
+    if _async_api_resource is not None:
+        await _async_api_resource.aclose()
+
+def _freebusy_body(time_min, time_max, calendar_ids):
+    return {
+        'timeMin': time_min,
+        'timeMax': time_max,
+        'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+    }
+
+def _merge_busy(result):
+    """Flattens a FreeBusy response into a merged, sorted list of (start, end) datetimes."""
+    intervals = sorted(
+        (datetime.fromisoformat(busy['start']), datetime.fromisoformat(busy['end']))
+        for calendar in result.get('calendars', {}).values()
+        for busy in calendar.get('busy', [])
+    )
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+async def acheck_busy(time_min, time_max, calendar_ids=('primary',), client=None):
+    """
+    Returns the merged busy intervals across calendar_ids between time_min and
+    time_max as a sorted list of (start, end) timezone-aware datetimes.
+    Uses a single FreeBusy query instead of listing every event; one query
+    already covers any number of calendars and any span of candidate slots,
+    so there is nothing left for a batch request to combine.
+    """
+    if client is None:
+        client = get_async_api_resource()
+    result = await client.query_freebusy(_freebusy_body(time_min, time_max, calendar_ids))
+    return _merge_busy(result)
@@ -1,42 +1,35 @@
 
-import os
+import re
+import time
+import atexit
+import shelve
 import asyncio
+import threading
 import uuid
-import nest_asyncio # For allowing nested asyncio event loops
-from typing import Dict, List, Any
+import weakref
+import functools
 import streamlit as st
-import tempfile # For temporary audio files
-
-# Apply nest_asyncio to allow asyncio.run() to be called from a running event loop
-nest_asyncio.apply()
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO # For in-memory audio buffers
 
 # Import components from your refactored files
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.tools import StructuredTool
 from langchain_core.messages import HumanMessage, AIMessage
-# from functools import partial # No longer needed for smart_schedule_meeting
 
 # Import your tool functions and Pydantic schemas
+from google_calendar_api import get_async_api_resource, aclose_async_api_resource
 from tools import (
     get_current_datetime_with_timezone,
     parse_natural_datetime,
-    smart_schedule_meeting, # smart_schedule_meeting now uses module-level api_resource
-    GetCurrentDatetimeInput,
+    smart_schedule_meeting,
     ParseNaturalDatetimeInput,
     ScheduleMeetingInput
 )
 
-# Import the API resource initialization from its module
-# The api_resource is initialized here when this module is imported
-from google_calendar_api import api_resource # Import the already initialized api_resource
-
-# Import voice I/O functions and related libraries
-import speech_recognition as sr
-from gtts import gTTS
-from pydub import AudioSegment
-from pydub.playback import play # Keep play for direct use if needed, but st.audio is preferred for web
+# Heavy voice I/O and LLM client libraries (speech_recognition, faster_whisper, gtts,
+# langchain_google_genai) are imported lazily at first use to keep each rerun light.
 from dotenv import load_dotenv
 load_dotenv()
 # --- Streamlit App Setup ---
@@ -50,34 +43,126 @@ if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
     st.session_state.chat_history.append(AIMessage(content="Welcome! I can help schedule meetings. Say 'new' to start a new session or 'load' to enter a session ID."))
     st.session_state.current_session_id = None # To hold the ID the user is working with
-# The api_resource is now initialized directly from google_calendar_api.py on module import
-# No need to re-initialize it in session state unless you want a per-session API instance.
-# For simplicity, we assume one global api_resource for the app's lifetime.
+# The async Calendar client is built lazily by google_calendar_api.get_async_api_resource()
+# when the agent is first built, and bound into the ScheduleMeeting tool.
 
+# --- Session Event Loop ---
+# One event loop per session, reused for every interaction instead of a fresh asyncio.run() per click.
+class _SharedExecutor(ThreadPoolExecutor):
+    """Thread pool shared by every session loop; closing one session's loop must not shut it down."""
 
-# --- LangChain Agent Setup (initialized once per session) ---
-if "agent_executor" not in st.session_state:
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        pass
+
+@st.cache_resource(show_spinner=False)
+def get_io_executor():
+    """
+    Creates the thread pool used by asyncio.to_thread (microphone, ASR, TTS, credential
+    refresh) once per server process. Every session loop shares it instead of each
+    growing its own small default pool.
+    """
+    return _SharedExecutor(max_workers=16, thread_name_prefix='voice-io')
+
+def _close_session_loop(loop):
+    """Closes a finished session's loop, releasing its Calendar client session first."""
+    def close():
+        try:
+            loop.run_until_complete(aclose_async_api_resource())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+    if loop.is_running() or loop.is_closed():
+        return
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        close()
+    else:
+        # Called from a thread that is running another loop (e.g. Streamlit's server loop)
+        threading.Thread(target=close, name='session-loop-close', daemon=True).start()
+
+class SessionLoop:
+    """
+    Owns a session's event loop. Streamlit drops a session's state when the session
+    ends, and the finalizer then closes the loop (also run once at interpreter exit).
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(get_io_executor())
+        weakref.finalize(self, _close_session_loop, self.loop)
+
+if "session_loop" not in st.session_state:
+    st.session_state.session_loop = SessionLoop()
+
+def run_async(coro):
+    """Runs a coroutine to completion on this session's event loop."""
+    return st.session_state.session_loop.loop.run_until_complete(coro)
+
+# --- Persistent Chat Session Store ---
+SESSION_DB_FILE = 'sessions.db'
+
+@st.cache_resource(show_spinner=False)
+def get_session_db():
+    """Opens the on-disk chat session store (and a lock guarding it) once per server process."""
+    session_db = shelve.open(SESSION_DB_FILE)
+    atexit.register(session_db.close)
+    return session_db, threading.Lock()
+
+def save_session(session_id: str, chat_history: list):
+    """Persists a session's chat history; called only when a new message is appended."""
+    session_db, lock = get_session_db()
+    with lock:
+        session_db[session_id] = chat_history
+        session_db.sync()
+
+def load_session(session_id: str):
+    """Returns the stored chat history for session_id, or None if it doesn't exist."""
+    session_db, lock = get_session_db()
+    with lock:
+        return session_db.get(session_id)
+
+
+# --- LangChain Agent Setup (built once per session) ---
+# Not shared across sessions: the Gemini client opens its grpc_asyncio channel lazily on
+# the first event loop that drives it, and every session runs its own loop.
+def build_agent_executor() -> AgentExecutor:
+    """Builds the LLM, tools, prompt and AgentExecutor. Chat history is passed per call."""
     # Set your Google API Key
     # It's recommended to load this from an environment variable or a .env file
     # os.environ["GOOGLE_API_KEY"] = "YOUR_GEMINI_API_KEY" # Uncomment and replace if not using env vars
 
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.1)
 
+    # The agent often repeats the same datetime tool calls on retries, so memoize them.
+    # Parses are keyed by (phrase, reference datetime); an omitted reference is pinned to
+    # the current minute so cached relative phrases never go stale.
+    _cached_parse = functools.lru_cache(maxsize=512)(parse_natural_datetime)
+
+    @functools.lru_cache(maxsize=1)
+    def _current_datetime_for_minute(minute: int) -> str:
+        return get_current_datetime_with_timezone()
+
+    def cached_parse_natural_datetime(input_string: str, current_datetime_str: str = None):
+        if current_datetime_str is None:
+            current_datetime_str = _current_datetime_for_minute(int(time.time() // 60))
+        return _cached_parse(input_string, current_datetime_str)
+
+    # The current datetime is injected into the system prompt on every call (see
+    # process_chat_message) instead of being a tool, saving the agent a round trip.
     tools = [
         StructuredTool.from_function(
-            func=get_current_datetime_with_timezone,
-            name="GetCurrentDatetime",
-            description="Returns the current date and time including the timezone in ISO format (e.g., '2025-07-17T10:00:00+05:30').",
-            args_schema=GetCurrentDatetimeInput,
-        ),
-        StructuredTool.from_function(
-            func=parse_natural_datetime,
+            func=cached_parse_natural_datetime,
             name="ParseNaturalDatetime",
             description="Converts natural language like 'tomorrow at 10 AM' or 'next Friday 3pm' into a precise datetime in ISO format (yyyy-mm-ddThh:mm:ss).",
             args_schema=ParseNaturalDatetimeInput,
         ),
         StructuredTool.from_function(
-            func=smart_schedule_meeting, # Directly use smart_schedule_meeting, it now accesses api_resource globally
+            # Bind the API resource once so each tool call skips the lookup
+            coroutine=functools.partial(smart_schedule_meeting, api_resource=get_async_api_resource()),
             name="ScheduleMeeting",
             description="Smartly schedules a meeting. If the preferred time is busy, it suggests the next available 30-min slot.",
             args_schema=ScheduleMeetingInput,
@@ -85,118 +170,183 @@ if "agent_executor" not in st.session_state:
     ]
 
     prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a helpful AI assistant that can schedule meetings and understand natural language dates and times. Use the provided tools to assist the user. If you need more information to schedule a meeting (e.g., summary, start time, end time, duration), please ask the user clarifying questions. Always try to provide a clear summary of the scheduled meeting or suggested time."),
+        ("system", "You are a helpful AI assistant that can schedule meetings and understand natural language dates and times. The current date and time is {current_datetime}. Use the provided tools to assist the user. If you need more information to schedule a meeting (e.g., summary, start time, end time, duration), please ask the user clarifying questions. Always try to provide a clear summary of the scheduled meeting or suggested time."),
         ("placeholder", "{chat_history}"),
         ("human", "{input}"),
         ("placeholder", "{agent_scratchpad}"),
     ])
 
     agent = create_tool_calling_agent(llm, tools, prompt)
-    st.session_state.agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    # verbose=False: the per-step console tracing is pure overhead in the served app
+    return AgentExecutor(agent=agent, tools=tools, verbose=False)
+
+# Built once per session and kept with the session's event loop it runs on
+if "agent_executor" not in st.session_state:
+    st.session_state.agent_executor = build_agent_executor()
 
 # --- Voice I/O Functions for Streamlit ---
-r = sr.Recognizer()
+def get_recognizer():
+    """
+    Returns this session's SpeechRecognition recognizer, created on first use. It is cheap
+    to build and carries per-session calibration, so unlike the ASR model it isn't shared.
+    """
+    if "recognizer" not in st.session_state:
+        import speech_recognition as sr
+        st.session_state.recognizer = sr.Recognizer()
+    return st.session_state.recognizer
+
+@st.cache_resource(show_spinner=False)
+def get_asr():
+    """Loads the local int8-quantized faster-whisper model once per server process."""
+    from faster_whisper import WhisperModel
+    return WhisperModel('base.en', device='cpu', compute_type='int8')
+
+def transcribe_audio(wav_bytes: bytes) -> str:
+    """Transcribes WAV audio with the local faster-whisper model."""
+    segments, _ = get_asr().transcribe(BytesIO(wav_bytes), beam_size=1, vad_filter=True)
+    # Segments are decoded lazily, so join them here inside the worker thread
+    return " ".join(segment.text.strip() for segment in segments).strip()
 
 async def get_voice_input_streamlit() -> str:
     """Captures voice input from the microphone and converts it to text for Streamlit."""
+    import speech_recognition as sr
+
+    r = get_recognizer()
     with st.spinner("Listening... Say something!"):
         with sr.Microphone() as source:
-            r.adjust_for_ambient_noise(source)
+            # Calibrate this session's recognizer for ambient noise once, then keep that threshold
+            if not st.session_state.get("sr_calibrated"):
+                await asyncio.to_thread(r.adjust_for_ambient_noise, source)
+                r.dynamic_energy_threshold = False
+                st.session_state.sr_calibrated = True
             try:
                 audio = await asyncio.to_thread(r.listen, source, timeout=10, phrase_time_limit=10)
                 st.info("Recognizing...")
-                text = await asyncio.to_thread(r.recognize_google, audio)
+                text = await asyncio.to_thread(transcribe_audio, audio.get_wav_data())
+                if not text:
+                    st.warning("Could not understand audio.")
                 return text
             except sr.WaitTimeoutError:
                 st.warning("No speech detected.")
                 return ""
-            except sr.UnknownValueError:
-                st.warning("Could not understand audio.")
-                return ""
-            except sr.RequestError as e:
-                st.error(f"Could not request results from Google Speech Recognition service; {e}")
-                return ""
             except Exception as e:
                 st.error(f"An unexpected error occurred during voice input: {e}")
                 return ""
 
-async def speak_text_streamlit(text: str):
-    """Converts text to speech and plays it using gTTS and pydub for Streamlit."""
-    if not text:
+# Splits streamed text after sentence-ending punctuation so each sentence can be voiced early.
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+
+async def synthesize_speech(text: str) -> bytes:
+    """Converts text to MP3 bytes using gTTS."""
+    from gtts import gTTS
+
+    tts = gTTS(text=text, lang='en')
+    audio_bytes_io = BytesIO()
+    await asyncio.to_thread(tts.write_to_fp, audio_bytes_io)
+    return audio_bytes_io.getvalue()
+
+async def play_speech_streamlit(synthesis_tasks: list):
+    """Waits for the gTTS synthesis tasks and plays their MP3 bytes as one clip via st.audio."""
+    if not synthesis_tasks:
         return
-    
+
     with st.spinner("Bot is speaking..."):
         try:
-            tts = gTTS(text=text, lang='en')
-            
-            # Use tempfile to create a temporary audio file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fp:
-                audio_file_path = fp.name
-                await asyncio.to_thread(tts.save, audio_file_path)
-            
-            # Load and play using pydub, then display with st.audio
-            audio_segment = AudioSegment.from_file(audio_file_path, format="mp3")
-            
-            # Export to a BytesIO object for st.audio
-            from io import BytesIO
-            audio_bytes_io = BytesIO()
-            audio_segment.export(audio_bytes_io, format="mp3")
-            audio_bytes_io.seek(0) # Rewind to the beginning
-            
-            st.audio(audio_bytes_io.read(), format="audio/mp3", start_time=0)
-            
-            os.remove(audio_file_path) # Clean up the temporary file
+            # MP3 frames can be concatenated, so sentence clips join into a single player
+            audio_chunks = await asyncio.gather(*synthesis_tasks)
+            st.audio(b"".join(audio_chunks), format="audio/mp3", start_time=0)
         except Exception as e:
             st.error(f"Error during text-to-speech or playback: {e}")
-            st.warning("Please ensure FFmpeg is installed and accessible in your system's PATH for MP3 playback with pydub.")
+
+async def speak_text_streamlit(text: str):
+    """Converts text to speech with gTTS and plays the MP3 bytes directly via st.audio."""
+    if not text:
+        return
+    await play_speech_streamlit([asyncio.create_task(synthesize_speech(text))])
 
 # --- Chat Processing Function ---
 async def process_chat_message(user_input: str):
     st.session_state.chat_history.append(HumanMessage(content=user_input))
 
+    synthesis_tasks = []
     with st.spinner("Bot is thinking..."):
         try:
-            # Define a synchronous wrapper function to run the agent's synchronous invoke method
-            def sync_invoke_agent(agent_exec: AgentExecutor, input_data: str, chat_history_data: List[Any]) -> Dict[str, Any]:
-                # This function runs in a separate thread.
-                # It calls the synchronous 'invoke' method of the AgentExecutor.
-                return agent_exec.invoke({
-                    "input": input_data,
-                    "chat_history": chat_history_data
-                })
-
-            # Use asyncio.to_thread to run the synchronous agent invocation in a separate thread.
-            # This avoids nested asyncio.run() calls and potential loop conflicts.
-            result = await asyncio.to_thread(
-                sync_invoke_agent,
-                st.session_state.agent_executor, # Pass the agent_executor instance
-                user_input,
-                st.session_state.chat_history
-            )
-
-            ai_response = result["output"]
+            # Stream the agent's run and start synthesizing each completed sentence
+            # while the rest of the reply is still being generated.
+            ai_response = ""
+            pending_text = ""
+            async for event in st.session_state.agent_executor.astream_events(
+                {
+                    "input": user_input,
+                    "chat_history": st.session_state.chat_history,
+                    "current_datetime": get_current_datetime_with_timezone(),
+                },
+                version="v2",
+            ):
+                kind = event["event"]
+                if kind == "on_chat_model_start":
+                    # Only the last model call produces the final answer; drop speech
+                    # queued for text emitted before an intermediate tool call.
+                    for task in synthesis_tasks:
+                        task.cancel()
+                    synthesis_tasks = []
+                    pending_text = ""
+                elif kind == "on_chat_model_stream":
+                    content = event["data"]["chunk"].content
+                    if isinstance(content, str):
+                        pending_text += content
+                    *sentences, pending_text = SENTENCE_END_RE.split(pending_text)
+                    for sentence in sentences:
+                        synthesis_tasks.append(asyncio.create_task(synthesize_speech(sentence)))
+                elif kind == "on_chain_end" and not event["parent_ids"]:
+                    ai_response = event["data"]["output"]["output"]
+
+            if pending_text.strip():
+                synthesis_tasks.append(asyncio.create_task(synthesize_speech(pending_text)))
             st.session_state.chat_history.append(AIMessage(content=ai_response))
-            await speak_text_streamlit(ai_response) # Speak the response
         except Exception as e:
+            for task in synthesis_tasks:
+                task.cancel()
             st.error(f"An error occurred: {e}. Please try again.")
             st.session_state.chat_history.append(AIMessage(content=f"I'm sorry, an error occurred: {e}. Please try again."))
+            save_session(st.session_state.session_id, st.session_state.chat_history)
             await speak_text_streamlit("I'm sorry, an error occurred. Please try again.")
+            return
+
+    save_session(st.session_state.session_id, st.session_state.chat_history)
+    await play_speech_streamlit(synthesis_tasks) # Speak the response
 
 # --- Streamlit UI Layout ---
 
-# Display chat messages
-for message in st.session_state.chat_history:
-    if isinstance(message, HumanMessage):
-        with st.chat_message("user"):
-            st.markdown(message.content)
-    else:
-        with st.chat_message("assistant"):
-            st.markdown(message.content)
+def render_messages(messages: list):
+    """Renders chat messages as user/assistant chat bubbles."""
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            with st.chat_message("user"):
+                st.markdown(message.content)
+        else:
+            with st.chat_message("assistant"):
+                st.markdown(message.content)
+
+def render_new_messages():
+    """Appends only the messages added during this run to the chat container."""
+    global rendered_count
+    with chat_container:
+        render_messages(st.session_state.chat_history[rendered_count:])
+    rendered_count = len(st.session_state.chat_history)
+
+# Display chat messages; new turns are appended to this container as they're processed
+# instead of needing another full rerun to show up.
+chat_container = st.container()
+with chat_container:
+    render_messages(st.session_state.chat_history)
+rendered_count = len(st.session_state.chat_history)
 
 # Input area for text messages
 user_text_input = st.chat_input("Type your message here...", key="text_input")
 if user_text_input:
-    asyncio.run(process_chat_message(user_text_input))
+    run_async(process_chat_message(user_text_input))
+    render_new_messages()
 
 # Buttons for voice input and session management
 col1, col2, col3 = st.columns([1, 1, 2])
@@ -204,9 +354,10 @@ col1, col2, col3 = st.columns([1, 1, 2])
 with col1:
     if st.button("Speak", key="speak_button"):
         st.session_state.text_input_value = "" # Clear text input when speaking
-        user_voice_input = asyncio.run(get_voice_input_streamlit())
+        user_voice_input = run_async(get_voice_input_streamlit())
         if user_voice_input:
-            asyncio.run(process_chat_message(user_voice_input))
+            run_async(process_chat_message(user_voice_input))
+            render_new_messages()
 
 with col2:
     if st.button("New Session", key="new_session_button"):
@@ -219,9 +370,10 @@ with col3:
     # Option to load a session by ID
     load_session_id = st.text_input("Load Session ID:", value=st.session_state.get('load_session_input', ''), key='load_session_input_box')
     if st.button("Load Session", key="load_session_button"):
-        if load_session_id in st.session_state.get('all_sessions', {}): # Assuming a way to store all sessions
+        loaded_history = load_session(load_session_id)
+        if loaded_history is not None:
             st.session_state.session_id = load_session_id
-            st.session_state.chat_history = st.session_state.all_sessions[load_session_id]
+            st.session_state.chat_history = loaded_history
             st.session_state.current_session_id = load_session_id
             st.success(f"Session '{load_session_id}' loaded.")
             st.rerun()
@@ -236,11 +388,3 @@ st.sidebar.markdown("Type or speak your meeting request. Example: 'Schedule a me
 st.sidebar.markdown("Click 'Speak' to use your microphone.")
 st.sidebar.markdown("Use 'New Session' to start fresh.")
 st.sidebar.markdown("Enter an ID and click 'Load Session' to continue a previous chat.")
-
-# --- Persistence for chat_sessions (Simple in-memory for now) ---
-# In a real app, you'd save st.session_state.chat_history to a database/file
-# For demonstration, we'll use a simple in-memory dictionary for 'all_sessions'
-# that gets updated on reruns. This is not truly persistent across app restarts.
-if 'all_sessions' not in st.session_state:
-    st.session_state.all_sessions = {}
-st.session_state.all_sessions[st.session_state.session_id] = st.session_state.chat_history
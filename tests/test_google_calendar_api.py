@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from google_calendar_api import MockGoogleCalendarAPI, _iso_to_epoch
+
+# 2025-07-17T10:00:00+05:30
+TEN_AM_IST = 1752726600
+
+
+@pytest.mark.parametrize("value", [
+    "2025-07-17T10:00:00",
+    "2025-07-17T10:00",
+    "2025-07-17T04:30:00Z",
+    "2025-07-17T04:30:00.250Z",
+    "2025-07-17T10:00:00+05:30",
+    "2025-07-17T10:00:00+0530",
+    "2025-07-16T23:30:00-05:00",
+])
+def test_iso_to_epoch(value):
+    assert int(_iso_to_epoch(value)) == TEN_AM_IST
+
+
+def _event(start, end):
+    return {
+        'summary': 'busy',
+        'start': {'dateTime': start, 'timeZone': 'Asia/Kolkata'},
+        'end': {'dateTime': end, 'timeZone': 'Asia/Kolkata'},
+    }
+
+
+def test_insert_grows_buffers_and_keeps_start_order():
+    api = MockGoogleCalendarAPI()
+    hours = list(range(24))
+    random.Random(0).shuffle(hours)
+    for hour in hours:
+        api.insert_event('primary', _event(f"2025-07-17T{hour:02d}:00:00+05:30", f"2025-07-17T{hour:02d}:30:00+05:30"))
+
+    assert api._count == 24
+    assert len(api._starts) >= 24
+    starts = api._starts[:24].tolist()
+    assert starts == sorted(starts)
+    assert [event['start']['dateTime'][11:13] for event in api._events] == [f"{hour:02d}" for hour in range(24)]
+    assert (api._ends[:24] - api._starts[:24]).tolist() == [1800] * 24
+
+
+def test_overlapping_reaches_back_by_the_longest_event():
+    api = MockGoogleCalendarAPI()
+    api.insert_event('primary', _event("2025-07-17T08:00:00+05:30", "2025-07-17T14:00:00+05:30"))
+    api.insert_event('primary', _event("2025-07-17T11:00:00+05:30", "2025-07-17T11:30:00+05:30"))
+    api.insert_event('primary', _event("2025-07-17T12:15:00+05:30", "2025-07-17T12:45:00+05:30"))
+    api.insert_event('primary', _event("2025-07-17T13:00:00+05:30", "2025-07-17T13:30:00+05:30"))
+
+    window = (_iso_to_epoch("2025-07-17T12:00:00+05:30"), _iso_to_epoch("2025-07-17T13:00:00+05:30"))
+    starts = [api._events[i]['start']['dateTime'][11:16] for i in api._overlapping(*window)]
+    # The 08:00 event started long before the window but is still running in it
+    assert starts == ["08:00", "12:15"]
@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+import tools
+from google_calendar_api import MockGoogleCalendarAPI, _AsyncMockCalendar
+
+# A Wednesday evening in Asia/Kolkata
+NOW = '2025-07-16T18:20:00+05:30'
+
+
+@pytest.mark.parametrize("phrase, expected", [
+    ("in an hour", "2025-07-16T19:20:00+05:30"),
+    ("in a minute", "2025-07-16T18:21:00+05:30"),
+    ("in a week", "2025-07-23T18:20:00+05:30"),
+    ("in one day", "2025-07-17T18:20:00+05:30"),
+    ("in 2 hours", "2025-07-16T20:20:00+05:30"),
+    ("tomorrow at 10 AM", "2025-07-17T10:00:00+05:30"),
+    ("next Friday 3pm", "2025-07-18T15:00:00+05:30"),
+    ("day after tomorrow 9am", "2025-07-18T09:00:00+05:30"),
+    ("3 p.m.", "2025-07-16T15:00:00+05:30"),
+    ("July 20", "2025-07-20T18:20:00+05:30"),
+    ("2025-07-17T10:00:00Z", "2025-07-17T15:30:00+05:30"),
+])
+def test_parse_natural_datetime_accepts(phrase, expected):
+    assert tools.parse_natural_datetime(phrase, NOW) == {"parsed_datetime": expected}
+
+
+@pytest.mark.parametrize("phrase", ["", "   "])
+def test_parse_natural_datetime_rejects_empty(phrase):
+    assert "input is empty" in tools.parse_natural_datetime(phrase, NOW)["error"]
+
+
+@pytest.mark.parametrize("phrase", ["summary", "hello there", "notes about marketing", "asdf qwer"])
+def test_parse_natural_datetime_rejects_date_free_input(phrase, monkeypatch):
+    fast_parse = tools._fast_parse
+
+    def parse_reference_only(value, *args, **kwargs):
+        assert value == NOW, "date-free input reached the fuzzy parser"
+        return fast_parse(value, *args, **kwargs)
+
+    monkeypatch.setattr(tools, "_fast_parse", parse_reference_only)
+    assert "no date or time found" in tools.parse_natural_datetime(phrase, NOW)["error"]
+
+
+def _ist(hhmm, day="2025-07-17"):
+    return f"{day}T{hhmm}:00+05:30"
+
+
+@pytest.mark.parametrize("end, expected", [
+    ("10:00", "10:30"),
+    ("10:25", "10:30"),
+    ("10:26", "11:00"),
+    ("10:55", "11:00"),
+    ("10:56", "11:30"),
+])
+def test_next_slot_leaves_a_buffer_and_rounds_up_to_the_half_hour(end, expected):
+    ts = int(datetime.fromisoformat(_ist(end)).timestamp())
+    assert tools._next_slot(ts) == int(datetime.fromisoformat(_ist(expected)).timestamp())
+
+
+def _schedule(busy, start, end):
+    api = MockGoogleCalendarAPI()
+    for busy_start, busy_end in busy:
+        api.insert_event('primary', {
+            'summary': 'busy',
+            'start': {'dateTime': _ist(busy_start), 'timeZone': 'Asia/Kolkata'},
+            'end': {'dateTime': _ist(busy_end), 'timeZone': 'Asia/Kolkata'},
+        })
+    result = asyncio.run(tools.smart_schedule_meeting(
+        "Sync", _ist(start), _ist(end), api_resource=_AsyncMockCalendar(api)))
+    return result, api
+
+
+def test_schedule_meeting_books_a_free_slot():
+    result, api = _schedule([("09:00", "10:00")], "10:00", "10:30")
+    assert result["status"] == "success"
+    assert result["event"]["start"]["dateTime"] == _ist("10:00")
+    assert api._count == 2
+
+
+@pytest.mark.parametrize("busy, start, end, suggested", [
+    # Overlap: the next half-hour mark at least 5 minutes after the conflict ends
+    ([("10:00", "11:00")], "10:30", "11:00", ("11:30", "12:00")),
+    # Adjacent busy blocks are merged, so the suggestion follows the last one
+    ([("10:00", "11:00"), ("11:00", "11:45")], "10:00", "10:30", ("12:00", "12:30")),
+    # Back-to-back blocks with gaps too short for the meeting are swept past
+    ([("10:00", "11:00"), ("11:30", "12:30"), ("13:00", "14:00")], "10:00", "11:00", ("14:30", "15:30")),
+])
+def test_schedule_meeting_suggests_the_next_free_slot(busy, start, end, suggested):
+    result, api = _schedule(busy, start, end)
+    assert result["status"] == "conflict"
+    assert (result["suggested_start"], result["suggested_end"]) == (_ist(suggested[0]), _ist(suggested[1]))
+    assert api._count == len(busy)
+
+
+def test_schedule_meeting_gives_up_when_the_window_is_full():
+    # SUGGESTION_WINDOW (8h) after a 10:30 end reaches 18:30; the calendar is busy until 19:00
+    result, _ = _schedule([("10:00", "19:00")], "10:00", "10:30")
+    assert result["status"] == "conflict"
+    assert "also unavailable" in result["message"]
@@ -1,139 +1,225 @@
 
+import re
 from datetime import datetime, timedelta
-import pytz
-from typing import Dict, Any
-from dateutil.parser import parse as dateutil_parse
+from zoneinfo import ZoneInfo
+from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 
-# Import api_resource from google_calendar_api module
-# This api_resource is already initialized (either real or mock) when this module is imported.
-from google_calendar_api import api_resource
+# The Calendar API client (real or mock) is initialized lazily on first tool use.
+from google_calendar_api import get_async_api_resource, acheck_busy
+
+# Fixed timezone for all scheduling, resolved once at import
+_TZ_NAME = 'Asia/Kolkata'
+_TZ = ZoneInfo(_TZ_NAME)
+
+# How far past the preferred slot to look for a free one on conflict (seconds).
+SUGGESTION_WINDOW = 8 * 3600
+
+# dateutil's parser is imported on first use; ISO input never needs it.
+_dateutil_parse = None
+
+# Deterministic grammar for the phrases users actually say ("tomorrow at 10 AM",
+# "next Friday 3pm", "in 2 hours"), tried before dateutil's fuzzy parser.
+_QUICK_RE = re.compile(
+    r'(?:(?P<day>today|tomorrow|day\s+after\s+tomorrow)'
+    r'|(?:(?P<rel>next|this)\s+)?(?P<weekday>mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?'
+    r'|thu(?:r(?:s(?:day)?)?)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?))?'
+    r'(?:\s*,?\s*(?:at\s+)?(?P<hour>\d{1,2})(?::(?P<minute>\d\d))?\s*(?:(?P<ampm>[ap])\.?m\.?)?)?'
+)
+_IN_RE = re.compile(r'in\s+(?P<count>\d+|an?|one)\s+(?P<unit>min(?:ute)?|h(?:ou)?r|day|week)s?')
+# Anything dateutil could turn into a date contains a digit or one of these words;
+# input the quick grammar can't resolve and that has neither is rejected instead of
+# going through a full fuzzy parse.
+_DATE_TOKEN_RE = re.compile(
+    r'\d|\b(?:today|tomorrow|tonight|noon|midnight|next|after|[ap]\.?m'
+    r'|mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?'
+    r'|jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+    r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b',
+    re.IGNORECASE,
+)
+_WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+_UNITS = {'min': 'minutes', 'minute': 'minutes', 'hr': 'hours', 'hour': 'hours', 'day': 'days', 'week': 'weeks'}
+
+# --- Helpers ---
+
+def _fast_parse(value: str, default_tz, default: datetime = None) -> datetime:
+    """
+    Parses an ISO-8601 string with datetime.fromisoformat, falling back to dateutil's
+    fuzzy parser only when that fails. Returns an aware datetime in default_tz; naive
+    values are taken to be in default_tz.
+    """
+    global _dateutil_parse
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        if _dateutil_parse is None:
+            from dateutil.parser import parse as _dateutil_parse
+        dt = _dateutil_parse(value, fuzzy=True, default=default)
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=default_tz)
+    return dt.astimezone(default_tz)
+
+def _quick_parse(text: str, now: datetime):
+    """
+    Resolves a lower-cased phrase from _QUICK_RE/_IN_RE's vocabulary relative to now.
+    Returns None when the phrase is outside that vocabulary, so the caller can fall back.
+    """
+    m = _IN_RE.fullmatch(text)
+    if m is not None:
+        count = m['count']
+        count = int(count) if count.isdigit() else 1
+        return now + timedelta(**{_UNITS[m['unit']]: count})
+
+    m = _QUICK_RE.fullmatch(text)
+    # A bare number is ambiguous (day of month or hour), so a time alone needs am/pm.
+    if m is None or not (m['day'] or m['weekday'] or m['ampm']):
+        return None
+
+    if m['weekday']:
+        days_ahead = (_WEEKDAYS[m['weekday'][:3]] - now.weekday()) % 7
+        if days_ahead == 0 and m['rel'] == 'next':
+            days_ahead = 7
+    elif m['day'] is None or m['day'] == 'today':
+        days_ahead = 0
+    elif m['day'] == 'tomorrow':
+        days_ahead = 1
+    else:
+        days_ahead = 2
+    dt = now + timedelta(days=days_ahead)
+
+    if m['hour'] is not None:
+        hour = int(m['hour'])
+        minute = int(m['minute'] or 0)
+        if m['ampm']:
+            if not 1 <= hour <= 12:
+                return None
+            hour = hour % 12 + (12 if m['ampm'] == 'p' else 0)
+        if hour > 23 or minute > 59:
+            return None
+        dt = dt.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return dt
+
+def _next_slot(ts: int) -> int:
+    """
+    Adds a 5-minute buffer to epoch seconds ts, drops the seconds and rounds up to the
+    next 30-minute mark. Asia/Kolkata's +05:30 offset is a whole number of half hours,
+    so UTC and local 30-minute marks coincide.
+    """
+    return ((ts + 300) // 60 * 60 + 1799) // 1800 * 1800
 
 # --- Tool Functions ---
 
 def get_current_datetime_with_timezone() -> str:
     """Returns the current date and time including the timezone in ISO format."""
-    time_zone = 'Asia/Kolkata'
-    tz = pytz.timezone(time_zone)
-    now = datetime.now(tz)
+    now = datetime.now(_TZ)
     return now.isoformat()
 
-def parse_natural_datetime(input_string: str, current_datetime_str: str) -> Dict[str, str]:
+def parse_natural_datetime(input_string: str, current_datetime_str: Optional[str] = None) -> Dict[str, str]:
     """
     Converts natural language like 'tomorrow at 10 AM' or 'next Friday 3pm'
     into a precise datetime in ISO format (yyyy-mm-ddThh:mm:ss).
-    Uses dateutil.parser for robust parsing.
+    Common phrases are resolved by a small regex grammar and ISO-8601 input is parsed
+    directly; anything else falls back to dateutil.parser.
+    Relative phrases are resolved against current_datetime_str, or the current time if omitted.
     """
-    time_zone = 'Asia/Kolkata'
-    tz = pytz.timezone(time_zone)
-
+    if not input_string or not input_string.strip():
+        return {"error": "Could not parse natural datetime: the input is empty. Please provide a date or time."}
     try:
-        current_dt = tz.localize(datetime.fromisoformat(current_datetime_str).replace(tzinfo=None))
-        parsed_dt = dateutil_parse(input_string, fuzzy=True, default=current_dt)
-        
-        if parsed_dt.tzinfo is None:
-            parsed_dt = tz.localize(parsed_dt)
+        if current_datetime_str is None:
+            current_dt = datetime.now(_TZ)
         else:
-            parsed_dt = parsed_dt.astimezone(tz)
-
+            current_dt = _fast_parse(current_datetime_str, _TZ)
+        parsed_dt = _quick_parse(input_string.strip().lower(), current_dt)
+        if parsed_dt is None:
+            if _DATE_TOKEN_RE.search(input_string) is None:
+                return {"error": f"Could not parse natural datetime: no date or time found in '{input_string}'. Please try a more specific format."}
+            parsed_dt = _fast_parse(input_string, _TZ, default=current_dt)
         return {"parsed_datetime": parsed_dt.isoformat()}
     except Exception as e:
         return {"error": f"Could not parse natural datetime: {e}. Please try a more specific format."}
 
-def smart_schedule_meeting(
+async def smart_schedule_meeting(
     summary: str,
     preferred_start: str,
     preferred_end: str,
-    calendar_id: str = 'primary'
+    calendar_id: str = 'primary',
+    api_resource: Any = None
 ) -> Dict[str, Any]:
     """
     Smartly schedules a meeting, checking for conflicts and suggesting alternative slots.
-    This function now directly uses the 'api_resource' imported at the module level.
+    api_resource is normally bound once by the caller (e.g. via functools.partial);
+    if omitted, the shared async client from get_async_api_resource() is used.
+    Calendar calls are awaited, so the agent's event loop is never blocked on HTTP.
     """
-    # Access api_resource directly from the module scope
-    global api_resource 
-
-    time_zone = 'Asia/Kolkata' 
+    if api_resource is None:
+        api_resource = get_async_api_resource()
 
     if not all([summary, preferred_start, preferred_end]):
         return {"status": "error", "message": "Missing required meeting details (summary, preferred_start, preferred_end)."}
 
     try:
-        tz = pytz.timezone(time_zone)
-        start_dt = tz.localize(datetime.fromisoformat(preferred_start).replace(tzinfo=None))
-        end_dt = tz.localize(datetime.fromisoformat(preferred_end).replace(tzinfo=None))
+        start_dt = _fast_parse(preferred_start, _TZ)
+        end_dt = _fast_parse(preferred_end, _TZ)
 
         start_iso = start_dt.isoformat()
         end_iso = end_dt.isoformat()
 
-        events_result = api_resource.events().list(
-            calendarId=calendar_id,
-            timeMin=start_iso,
-            timeMax=end_iso,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        conflicting_events = events_result.get('items', [])
-
-        if not conflicting_events:
+        start_ts = int(start_dt.timestamp())
+        end_ts = int(end_dt.timestamp())
+        duration = end_ts - start_ts
+
+        # One FreeBusy query covers both the preferred slot and the suggestion window,
+        # as (start, end) epoch seconds so the sweep below is plain int arithmetic.
+        window_end_ts = end_ts + SUGGESTION_WINDOW
+        busy = [
+            (int(busy_start.timestamp()), int(busy_end.timestamp()))
+            for busy_start, busy_end in await acheck_busy(
+                start_iso, datetime.fromtimestamp(window_end_ts, _TZ).isoformat(),
+                [calendar_id], client=api_resource)
+        ]
+
+        # Busy intervals are merged and sorted, so the ones overlapping the preferred slot form a prefix.
+        conflicts = 0
+        while conflicts < len(busy) and busy[conflicts][0] < end_ts:
+            conflicts += 1
+
+        if not conflicts:
             event = {
                 'summary': summary,
-                'start': {'dateTime': start_iso, 'timeZone': time_zone},
-                'end': {'dateTime': end_iso, 'timeZone': time_zone},
+                'start': {'dateTime': start_iso, 'timeZone': _TZ_NAME},
+                'end': {'dateTime': end_iso, 'timeZone': _TZ_NAME},
             }
-            created_event = api_resource.events().insert(calendarId=calendar_id, body=event).execute()
+            created_event = await api_resource.insert_event(calendar_id, event)
             return {"status": "success", "message": "Meeting scheduled.", "event": created_event}
         else:
-            suggested_start_dt = end_dt
-            for conflict in conflicting_events:
-                conflict_end_dt = tz.localize(datetime.fromisoformat(conflict['end']['dateTime']).replace(tzinfo=None))
-                if conflict_end_dt > suggested_start_dt:
-                    suggested_start_dt = conflict_end_dt
-
-            suggested_start_dt += timedelta(minutes=5)
-            minutes = suggested_start_dt.minute
-            remainder = minutes % 30
-            if remainder != 0:
-                suggested_start_dt += timedelta(minutes=(30 - remainder))
-            suggested_start_dt = suggested_start_dt.replace(second=0, microsecond=0)
-
-            duration = end_dt - start_dt
-            suggested_end_dt = suggested_start_dt + duration
-
-            suggested_events_result = api_resource.events().list(
-                calendarId=calendar_id,
-                timeMin=suggested_start_dt.isoformat(),
-                timeMax=suggested_end_dt.isoformat(),
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-
-            if not suggested_events_result.get('items', []):
+            # Sweep the remaining busy intervals for the first gap that fits the meeting.
+            cursor = _next_slot(max(end_ts, busy[conflicts - 1][1]))
+            for busy_start, busy_end in busy[conflicts:]:
+                if busy_start >= cursor + duration:
+                    break
+                if busy_end > cursor:
+                    cursor = _next_slot(busy_end)
+
+            if cursor + duration <= window_end_ts:
                 return {
                     "status": "conflict",
                     "message": "Preferred time is busy. Suggested next available slot:",
-                    "suggested_start": suggested_start_dt.isoformat(),
-                    "suggested_end": suggested_end_dt.isoformat()
-                }
-            else:
-                return {
-                    "status": "conflict",
-                    "message": "Preferred time is busy and next suggested time is also unavailable. Please try another slot."
+                    "suggested_start": datetime.fromtimestamp(cursor, _TZ).isoformat(),
+                    "suggested_end": datetime.fromtimestamp(cursor + duration, _TZ).isoformat()
                 }
+            return {
+                "status": "conflict",
+                "message": "Preferred time is busy and next suggested times are also unavailable. Please try another slot."
+            }
     except Exception as e:
         print(f"Error in smart_schedule_meeting: {e}")
         return {"status": "error", "message": f"An error occurred: {str(e)}"}
 
 # --- Pydantic Models for Tool Input Schemas ---
-class GetCurrentDatetimeInput(BaseModel):
-    """Input for GetCurrentDatetime tool. Takes no arguments."""
-    pass
-
 class ParseNaturalDatetimeInput(BaseModel):
     """Input for ParseNaturalDatetime tool."""
     input_string: str = Field(description="The natural language phrase to parse (e.g., 'tomorrow 10 AM', 'next Friday 3pm').")
-    current_datetime_str: str = Field(description="The current datetime in ISO format, provided by GetCurrentDatetime tool.")
+    current_datetime_str: Optional[str] = Field(default=None, description="The current datetime in ISO format, as given in the system prompt. Defaults to now.")
 
 class ScheduleMeetingInput(BaseModel):
     """Input for ScheduleMeeting tool."""
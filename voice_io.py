@@ -1,45 +1,132 @@
 # voice_io.py
 import os
+import shutil
 import asyncio
-import speech_recognition as sr
-from gtts import gTTS
-from pydub import AudioSegment # Changed: Using pydub for audio segment manipulation
-from pydub.playback import play # Changed: Using pydub for audio playback
+from io import BytesIO
 
-# Recognizer instance for STT
-r = sr.Recognizer()
+# speech_recognition, gtts and pydub pull in large dependency trees, so they are
+# imported on first use rather than at module import.
 
-async def get_voice_input() -> str:
-    """Captures voice input from the microphone and converts it to text."""
+# Recognizer instance for STT, created on first use
+_recognizer = None
+# Set once calibrate_microphone() has measured ambient noise; the threshold lives on _recognizer
+_calibrated = False
+# Local faster-whisper model, loaded on first use
+_asr = None
+
+# Set USE_GOOGLE_STT=1 to send audio to the Google Web Speech API instead of transcribing locally
+USE_GOOGLE_STT = os.getenv("USE_GOOGLE_STT") == "1"
+
+def _get_recognizer():
+    global _recognizer
+    if _recognizer is None:
+        import speech_recognition as sr
+        _recognizer = sr.Recognizer()
+    return _recognizer
+
+def _get_asr():
+    global _asr
+    if _asr is None:
+        from faster_whisper import WhisperModel
+        _asr = WhisperModel('base.en', device='cpu', compute_type='int8')
+    return _asr
+
+def _transcribe(wav_bytes: bytes) -> str:
+    """Transcribes WAV audio with the local int8-quantized faster-whisper model."""
+    segments, _ = _get_asr().transcribe(BytesIO(wav_bytes), beam_size=1, vad_filter=True)
+    # Segments are decoded lazily, so join them here inside the worker thread
+    return " ".join(segment.text.strip() for segment in segments).strip()
+
+async def calibrate_microphone(duration: float = 1):
+    """
+    Calibrates the recognizer's energy threshold to ambient noise. Call once per session;
+    the threshold is kept on the recognizer, and its (default) dynamic adjustment keeps it
+    current between turns without recording another calibration sample.
+    """
+    import speech_recognition as sr
+
+    global _calibrated
+    r = _get_recognizer()
+    print("Calibrating microphone for ambient noise...")
     with sr.Microphone() as source:
-        print("\nSay something!")
-        r.adjust_for_ambient_noise(source) # Adjust for ambient noise
-        try:
-            audio = await asyncio.to_thread(r.listen, source, timeout=10, phrase_time_limit=10) # Listen for up to 5 seconds
-            print("Recognizing...")
+        await asyncio.to_thread(r.adjust_for_ambient_noise, source, duration)
+    _calibrated = True
+
+async def get_voice_input(listen_timeout: float = 10) -> str:
+    """
+    Captures voice input from the microphone and converts it to text.
+    listen_timeout bounds both the wait for speech to start and the phrase length (seconds).
+    """
+    import speech_recognition as sr
+
+    r = _get_recognizer()
+    try:
+        if not _calibrated:
+            await calibrate_microphone()
+        # The stream is opened per turn so it never buffers the bot's own TTS playback
+        with sr.Microphone() as source:
+            print("\nSay something!")
+            audio = await asyncio.to_thread(r.listen, source, timeout=listen_timeout, phrase_time_limit=listen_timeout)
+        print("Recognizing...")
+        if USE_GOOGLE_STT:
             text = await asyncio.to_thread(r.recognize_google, audio) # Use Google Web Speech API
-            print(f"You said: {text}")
-            return text
-        except sr.WaitTimeoutError:
-            print("No speech detected. Please try again.")
-            return ""
-        except sr.UnknownValueError:
-            print("Could not understand audio. Please try again.")
-            return ""
-        except sr.RequestError as e:
-            print(f"Could not request results from Google Speech Recognition service; {e}")
-            return ""
-        except Exception as e:
-            print(f"An unexpected error occurred during voice input: {e}")
-            return ""
+        else:
+            text = await asyncio.to_thread(_transcribe, audio.get_wav_data())
+            if not text:
+                print("Could not understand audio. Please try again.")
+                return ""
+        print(f"You said: {text}")
+        return text
+    except sr.WaitTimeoutError:
+        print("No speech detected. Please try again.")
+        return ""
+    except sr.UnknownValueError:
+        print("Could not understand audio. Please try again.")
+        return ""
+    except sr.RequestError as e:
+        print(f"Could not request results from Google Speech Recognition service; {e}")
+        return ""
+    except OSError as e:
+        print(f"Microphone error: {e}. Please check your audio input device.")
+        return ""
+    except Exception as e:
+        print(f"An unexpected error occurred during voice input: {e}")
+        return ""
+
+async def _stream_to_ffplay(tts):
+    """Pipes gTTS MP3 chunks straight into ffplay as they arrive; ffplay decodes MP3 itself."""
+    proc = await asyncio.create_subprocess_exec(
+        'ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet', '-i', 'pipe:0',
+        stdin=asyncio.subprocess.PIPE,
+    )
+    chunks = tts.stream()
+    try:
+        # gTTS fetches each chunk with a blocking HTTP request, so pull them off-loop.
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            proc.stdin.write(chunk)
+            await proc.stdin.drain()
+    finally:
+        proc.stdin.close()
+        await proc.wait()
 
 async def speak_text(text: str):
-    """Converts text to speech and plays it using gTTS and pydub."""
+    """Converts text to speech and plays it, streaming gTTS output into ffplay when available."""
     if not text:
         return
     print(f"Bot speaking: {text}")
     try:
+        from gtts import gTTS
+
         tts = gTTS(text=text, lang='en')
+
+        if shutil.which('ffplay'):
+            await _stream_to_ffplay(tts)
+            return
+
+        # Fallback without ffplay: save to a file and play it through pydub.
+        from pydub import AudioSegment
+        from pydub.playback import play
+
         audio_file = "bot_response.mp3"
         
         # Save the gTTS output to a temporary MP3 file
@@ -49,11 +136,10 @@ async def speak_text(text: str):
         audio = AudioSegment.from_file(audio_file, format="mp3")
         
         # Play the AudioSegment using pydub's playback.play
-        # This will use ffplay (from FFmpeg) for MP3 playback.
         await asyncio.to_thread(play, audio)
         
         os.remove(audio_file) # Clean up the temporary file
     except Exception as e:
         print(f"Error during text-to-speech or playback: {e}")
-        print("Please ensure FFmpeg is installed and accessible in your system's PATH for MP3 playback with pydub.")
+        print("Please ensure FFmpeg is installed and accessible in your system's PATH for MP3 playback.")
 